@@ -14,7 +14,9 @@ import threading
 import time
 import signal
 import queue
+import re
 import subprocess
+import shutil
 import sys
 import os
 
@@ -31,12 +33,15 @@ SILENCE_FLUSH = 0.7       # seconds of silence before flushing
 BLOCKSIZE = 512           # Silero's required window size at 16kHz
 MIN_SPEECH_DURATION = 0.3
 MID_FLUSH_INTERVAL = 5.0
+MAX_BUFFER_DURATION = 60  # seconds buffered between flushes (matches server limit)
+MAX_CHUNKS = MAX_BUFFER_DURATION * SAMPLE_RATE // BLOCKSIZE
 
 # Queue backpressure
 MAX_QUEUE_SIZE = 5
 
 # Server communication
 SOCKET_TIMEOUT = 30.0
+RECV_CHUNK = 1 << 20      # 1 MiB per recv
 
 
 def _is_wayland():
@@ -52,7 +57,7 @@ def _check_paste_deps():
 
     missing = []
     for cmd, pkg in deps:
-        if subprocess.run(["which", cmd], capture_output=True).returncode != 0:
+        if shutil.which(cmd) is None:
             missing.append(f"  {cmd} (install: sudo apt install {pkg})")
 
     if missing:
@@ -90,20 +95,39 @@ VOICE_COMMANDS = [
     ("press enter", press_enter),
 ]
 
+# All command phrases as one end-anchored alternation, ignoring trailing punctuation.
+# One named group per command: the handler is found via m.lastgroup, so Unicode case
+# folding in the match (e.g. "ſ" matching "s") can never miss the lookup.
+_CMD_RE = re.compile(
+    "(?:" + "|".join(f"(?P<cmd{i}>{re.escape(phrase)})" for i, (phrase, _) in enumerate(VOICE_COMMANDS))
+    + r")[ .!?,]*\Z",
+    re.IGNORECASE,
+)
+_CMD_MAP = {f"cmd{i}": fn for i, (_, fn) in enumerate(VOICE_COMMANDS)}
+
 
 def match_voice_command(text: str):
     """Check if text ends with a voice command. Returns (clean_text, command_fn) or (text, None)."""
-    lower = text.lower().rstrip(" .!?,")
-    for phrase, fn in VOICE_COMMANDS:
-        if lower.endswith(phrase):
-            # Strip the command phrase from the end
-            clean = lower[:len(lower) - len(phrase)].rstrip()
-            # Recover original casing for the text portion
-            clean = text[:len(clean)].rstrip()
-            return clean, fn
+    m = _CMD_RE.search(text)
+    if m:
+        # Strip the command phrase from the end, keeping original casing
+        return text[:m.start()].rstrip(), _CMD_MAP[m.lastgroup]
     return text, None
 
 
+def _recv_exact(sock, length):
+    """Receive up to `length` bytes straight into a preallocated buffer."""
+    buf = bytearray(length)
+    mv = memoryview(buf)
+    off = 0
+    while off < length:
+        n = sock.recv_into(mv[off:], min(RECV_CHUNK, length - off))
+        if not n:
+            break
+        off += n
+    return mv[:off]
+
+
 def check_server_health():
     """Ping the server with a zero-length request; expects 'OK' back."""
     try:
@@ -112,18 +136,13 @@ def check_server_health():
         sock.connect(SOCKET_PATH)
         # Zero-length audio = health check
         sock.sendall(struct.pack("<I", 0))
-        header = sock.recv(4)
+        header = _recv_exact(sock, 4)
         if len(header) < 4:
             return False
         length = struct.unpack("<I", header)[0]
-        data = b""
-        while len(data) < length:
-            chunk = sock.recv(min(65536, length - len(data)))
-            if not chunk:
-                break
-            data += chunk
+        data = _recv_exact(sock, length)
         sock.close()
-        return data.decode("utf-8") == "OK"
+        return data.tobytes() == b"OK"
     except Exception:
         return False
 
@@ -144,23 +163,19 @@ def _is_garbage(text: str) -> bool:
 
 def transcribe_remote(audio: np.ndarray) -> str:
     """Send audio to the server, get text back."""
-    audio_bytes = audio.astype(np.float32).tobytes()
+    # Send straight from the array's buffer instead of copying it into a bytes object
+    audio = np.ascontiguousarray(audio, dtype=np.float32)
     sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
     sock.settimeout(SOCKET_TIMEOUT)
     sock.connect(SOCKET_PATH)
     try:
-        sock.sendall(struct.pack("<I", len(audio_bytes)) + audio_bytes)
-        header = sock.recv(4)
+        sock.sendall(struct.pack("<I", audio.nbytes))
+        sock.sendall(audio)
+        header = _recv_exact(sock, 4)
         if len(header) < 4:
             return ""
         length = struct.unpack("<I", header)[0]
-        data = b""
-        while len(data) < length:
-            chunk = sock.recv(min(65536, length - len(data)))
-            if not chunk:
-                break
-            data += chunk
-        text = data.decode("utf-8")
+        text = _recv_exact(sock, length).tobytes().decode("utf-8")
         if text.startswith("ERROR:"):
             print(f"\r\033[K  Server {text}")
             return ""
@@ -169,33 +184,52 @@ def transcribe_remote(audio: np.ndarray) -> str:
         sock.close()
 
 
+def _freeze_vad(model):
+    """Freeze and optimize the TorchScript Silero model for inference.
+
+    Falls back to the stock module if this Torch/Silero combination can't be frozen.
+    """
+    try:
+        frozen = torch.jit.freeze(model, preserved_attrs=["reset_states"])
+        return torch.jit.optimize_for_inference(frozen)
+    except (RuntimeError, AttributeError) as e:
+        print(f"  VAD freeze unavailable ({e}); using stock model")
+        return model
+
+
 class Dictation:
     def __init__(self):
         self.running = True
 
-        # Load Silero VAD
+        # Load Silero VAD (V5: fixed 512-sample window at 16kHz)
         print("Loading Silero VAD...")
+        torch.set_num_threads(1)  # batch=1 LSTM: extra intra-op threads only add overhead
         self.vad_model, _ = torch.hub.load(
             'snakers4/silero-vad', 'silero_vad',
             trust_repo=True,
         )
-        self.vad_model.eval()
+        self.vad_model = _freeze_vad(self.vad_model.eval())
+
+        # Reused VAD input: vad_input shares memory with vad_chunk
+        self.vad_chunk = np.empty((1, BLOCKSIZE), dtype=np.float32)
+        self.vad_input = torch.from_numpy(self.vad_chunk)
 
         # VAD state
         self.speaking = False
-        self.audio_buffer = []     # list of audio chunks
-        self.vad_probs = []        # parallel list of VAD probabilities
+        # Utterance buffer as parallel arrays: row i of audio_buffer has VAD prob vad_probs[i]
+        self.audio_buffer = np.empty((MAX_CHUNKS, BLOCKSIZE), dtype=np.float32)
+        self.vad_probs = np.empty(MAX_CHUNKS, dtype=np.float32)
+        self.n_chunks = 0
         self.silence_start = None
         self.speech_start = None
         self.last_flush = None
 
         self.transcribe_queue = queue.Queue(maxsize=MAX_QUEUE_SIZE)
 
-    def _get_vad_prob(self, audio_chunk):
-        """Get speech probability from Silero VAD for a 512-sample chunk."""
-        tensor = torch.from_numpy(audio_chunk).float()
+    def _get_vad_prob(self):
+        """Get speech probability from Silero VAD for the 512-sample chunk in vad_chunk."""
         with torch.no_grad():
-            return self.vad_model(tensor, SAMPLE_RATE).item()
+            return self.vad_model(self.vad_input, SAMPLE_RATE).item()
 
     def _enqueue_audio(self, audio):
         """Enqueue audio for transcription, dropping oldest if full."""
@@ -207,8 +241,9 @@ class Dictation:
         self.transcribe_queue.put(audio)
 
     def audio_callback(self, indata, frames, time_info, status):
-        audio = indata[:, 0].copy()
-        prob = self._get_vad_prob(audio)
+        self.vad_chunk[0] = indata[:, 0]
+        audio = self.vad_chunk[0]
+        prob = self._get_vad_prob()
         now = time.monotonic()
 
         if not self.speaking:
@@ -217,14 +252,13 @@ class Dictation:
                 self.speaking = True
                 self.speech_start = now
                 self.last_flush = now
-                self.audio_buffer = [audio]
-                self.vad_probs = [prob]
+                self.n_chunks = 0
+                self._append_chunk(audio, prob, now)
                 self.silence_start = None
                 print("\r\033[K  [listening...]", end="", flush=True)
         else:
             # Currently speaking
-            self.audio_buffer.append(audio)
-            self.vad_probs.append(prob)
+            self._append_chunk(audio, prob, now)
 
             if prob < VAD_NEG_THRESHOLD:
                 # Below negative threshold — track silence
@@ -240,20 +274,28 @@ class Dictation:
             if now - self.last_flush >= MID_FLUSH_INTERVAL:
                 self._mid_flush(now)
 
+    def _append_chunk(self, audio, prob, now):
+        """Store a chunk and its VAD probability in place (no allocation)."""
+        if self.n_chunks == MAX_CHUNKS:
+            self._mid_flush(now)
+        self.audio_buffer[self.n_chunks] = audio
+        self.vad_probs[self.n_chunks] = prob
+        self.n_chunks += 1
+
     def _find_split_point(self):
-        """Find a good split point by scanning backward for a low-probability chunk."""
-        if len(self.vad_probs) < 2:
-            return len(self.vad_probs)
+        """Find a good split point: just after the last low-probability chunk."""
+        if self.n_chunks < 2:
+            return self.n_chunks
 
-        # Scan backward from end, looking for a chunk below negative threshold
-        for i in range(len(self.vad_probs) - 1, -1, -1):
-            if self.vad_probs[i] < VAD_NEG_THRESHOLD:
-                return i + 1  # split after this low-prob chunk
-        # No good split point found — flush everything
-        return len(self.audio_buffer)
+        mask = self.vad_probs[:self.n_chunks] < VAD_NEG_THRESHOLD
+        if not mask.any():
+            # No good split point found — flush everything
+            return self.n_chunks
+        # argmax on the reversed mask finds the last chunk below the negative threshold
+        return self.n_chunks - int(np.argmax(mask[::-1]))
 
     def _mid_flush(self, now):
-        if not self.audio_buffer:
+        if not self.n_chunks:
             return
 
         split = self._find_split_point()
@@ -261,15 +303,14 @@ class Dictation:
             return
 
         # Split cleanly: flushed portion vs retained portion
-        flush_chunks = self.audio_buffer[:split]
-        retain_chunks = self.audio_buffer[split:]
-        retain_probs = self.vad_probs[split:]
-
-        self.audio_buffer = retain_chunks
-        self.vad_probs = retain_probs
+        # (copy: the flushed audio is handed to the worker thread)
+        audio = self.audio_buffer[:split].ravel().copy()
+        n_retain = self.n_chunks - split
+        self.audio_buffer[:n_retain] = self.audio_buffer[split:self.n_chunks]
+        self.vad_probs[:n_retain] = self.vad_probs[split:self.n_chunks]
+        self.n_chunks = n_retain
         self.last_flush = now
 
-        audio = np.concatenate(flush_chunks)
         if len(audio) / SAMPLE_RATE >= MIN_SPEECH_DURATION:
             self._enqueue_audio(audio)
 
@@ -283,14 +324,13 @@ class Dictation:
         # Reset VAD state for next utterance
         self.vad_model.reset_states()
 
-        if speech_duration < MIN_SPEECH_DURATION or not self.audio_buffer:
-            self.audio_buffer = []
-            self.vad_probs = []
+        if speech_duration < MIN_SPEECH_DURATION or not self.n_chunks:
+            self.n_chunks = 0
             return
 
-        audio = np.concatenate(self.audio_buffer)
-        self.audio_buffer = []
-        self.vad_probs = []
+        # Copy only because the worker thread takes ownership of the audio
+        audio = self.audio_buffer[:self.n_chunks].ravel().copy()
+        self.n_chunks = 0
         self._enqueue_audio(audio)
 
     def _transcription_worker(self):
@@ -12,11 +12,13 @@ import asyncio
 import json
 import base64
 import time as _time
+from collections import deque
 from pathlib import Path
 
 CONFIG_DIR = Path.home() / ".config" / "voicetype"
 PID_FILE = CONFIG_DIR / "voicetype.pid"
 CONFIG_FILE = CONFIG_DIR / "config.json"
+BLOCKSIZE = 800  # 50ms at 16kHz
 
 # Global state
 running = False
@@ -127,14 +129,23 @@ async def transcribe(config, tray):
         params += f"&language_code={config['language']}"
 
     url = f"wss://api.elevenlabs.io/v1/speech-to-text/realtime?{params}"
-    audio_queue = asyncio.Queue(maxsize=100)
+    # Filled from the PortAudio thread, drained by send(): deque append/popleft are
+    # thread-safe, unlike asyncio.Queue. When full, the oldest block is dropped.
+    audio_queue = deque(maxlen=100)
+
+    # Scratch buffers reused by the realtime callback (no per-block allocations)
+    scratch_f32 = np.empty(BLOCKSIZE, dtype=np.float32)
+    scratch_i16 = np.empty(BLOCKSIZE, dtype=np.int16)
 
     def audio_cb(indata, frames, time, status):
         if listening:
-            try:
-                audio_queue.put_nowait((indata[:, 0] * 32767).astype(np.int16).tobytes())
-            except asyncio.QueueFull:
-                pass
+            f32 = scratch_f32[:frames]
+            i16 = scratch_i16[:frames]
+            np.multiply(indata[:, 0], 32767.0, out=f32)
+            np.rint(f32, out=f32)
+            i16[:] = f32
+            # base64 happens in send(), off the audio thread
+            audio_queue.append(i16.tobytes())
 
     try:
         async with websockets.connect(url, additional_headers={"xi-api-key": api_key}) as ws:
@@ -143,7 +154,7 @@ async def transcribe(config, tray):
                 return
 
             stream = sd.InputStream(samplerate=16000, channels=1, dtype=np.float32,
-                                    blocksize=800, callback=audio_cb)
+                                    blocksize=BLOCKSIZE, callback=audio_cb)
             stream.start()
             tray.update(True)
             notify("Listening", "Speak now...")
@@ -153,14 +164,15 @@ async def transcribe(config, tray):
 
             async def send():
                 while listening and running:
+                    if not audio_queue:
+                        await asyncio.sleep(0.005)
+                        continue
+                    data = audio_queue.popleft()
                     try:
-                        data = await asyncio.wait_for(audio_queue.get(), 0.02)
                         await ws.send(json.dumps({
                             "message_type": "input_audio_chunk",
                             "audio_base_64": base64.b64encode(data).decode()
                         }))
-                    except asyncio.TimeoutError:
-                        continue
                     except websockets.exceptions.ConnectionClosed:
                         break
 